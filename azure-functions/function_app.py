@@ -1,12 +1,151 @@
 import azure.functions as func
+import asyncio
+import io
 import logging
 import json
 import os
+import zlib
 from datetime import datetime
-from googleapiclient.discovery import build
-from azure.storage.blob import BlobServiceClient
+import aiohttp
+import msgspec
+import ahocorasick
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from azure.storage.blob.aio import BlobServiceClient as AioBlobServiceClient
 import snowflake.connector
 
+YOUTUBE_API_URL = 'https://www.googleapis.com/youtube/v3'
+
+# Partial-response masks: the API only returns the fields the pipeline reads
+SEARCH_FIELDS = 'items(id(kind,videoId))'
+VIDEO_FIELDS = ('items(id,snippet(channelId,categoryId,title,description,tags,publishedAt),'
+                'statistics(viewCount,likeCount,commentCount))')
+CHANNEL_FIELDS = 'items(id,snippet(title,country),statistics(subscriberCount,videoCount))'
+
+class VideoRecord(msgspec.Struct):
+    """One collected video; a msgspec Struct so records are compact and encode in C"""
+    video_id: str
+    channel_id: str
+    category_id: int
+    title: str
+    description: str
+    tags: list
+    published_at: str
+    view_count: int
+    like_count: int
+    comment_count: int
+    engagement_rate: float
+    search_keyword: str
+    search_region: str
+    collected_at: str
+    final_sentiment: str
+    classification_method: str
+    positive_keyword_count: int
+    negative_keyword_count: int
+
+# Process-global clients, created lazily and reused by warm invocations of this
+# worker. aiohttp and aio blob clients are bound to the loop that created them,
+# so every coroutine runs on the one long-lived _loop.
+_loop = None
+_http_session = None
+_blob_service = None
+
+def run_async(coro):
+    """Run a coroutine on the worker's long-lived event loop"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+def get_http_session():
+    """Shared aiohttp session for YouTube calls (call from a coroutine on _loop)"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        # Cap in-flight requests to stay friendly with the YouTube quota
+        _http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=16))
+    return _http_session
+
+def get_blob_service(connection_string):
+    """Shared async BlobServiceClient (call from a coroutine on _loop)"""
+    global _blob_service
+    if _blob_service is None:
+        _blob_service = AioBlobServiceClient.from_connection_string(connection_string)
+    return _blob_service
+
+# Schema objects the loader writes to, created on the first load in this worker
+SCHEMA_DDL = [
+    # Named format so stage queries can read the Parquet files in place
+    "CREATE FILE FORMAT IF NOT EXISTS YOUTUBE_ANALYTICS.RAW.MY_PARQUET_FORMAT TYPE = PARQUET",
+    "CREATE SCHEMA IF NOT EXISTS YOUTUBE_ANALYTICS.ANALYTICS",
+    """
+    CREATE TABLE IF NOT EXISTS YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION (
+        analysis_date DATE,
+        channel_country VARCHAR(10),
+        final_sentiment VARCHAR(20),
+        video_count NUMBER,
+        total_views NUMBER,
+        total_likes NUMBER,
+        total_comments NUMBER,
+        avg_engagement_rate FLOAT
+    )
+    CLUSTER BY (analysis_date)
+    """,
+]
+
+# Cluster keys for existing tables. ALTER ... CLUSTER BY needs OWNERSHIP, so each
+# table is altered on its own and a failure only leaves that table unclustered.
+CLUSTER_KEYS = [
+    # Cluster on the aggregation's filter and join columns so today's
+    # rollup prunes to the newest micro-partitions
+    ('YOUTUBE_ANALYTICS.CORE.FACT_VIDEOS', 'collection_date, channel_id'),
+    # The channel MERGE joins on channel_id; clustering on it lets the join prune
+    ('YOUTUBE_ANALYTICS.CORE.DIM_CHANNELS', 'channel_id'),
+    # Tables created before the cluster key existed pick it up here
+    ('YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION', 'analysis_date'),
+]
+
+_schema_initialized = False
+
+# Parquet layout of the videos file; column names match the VideoRecord fields
+VIDEO_SCHEMA = pa.schema([
+    ('video_id', pa.string()),
+    ('channel_id', pa.string()),
+    ('category_id', pa.int64()),
+    ('title', pa.string()),
+    ('description', pa.string()),
+    ('tags', pa.list_(pa.string())),
+    ('published_at', pa.string()),
+    ('view_count', pa.int64()),
+    ('like_count', pa.int64()),
+    ('comment_count', pa.int64()),
+    ('engagement_rate', pa.float64()),
+    ('search_keyword', pa.string()),
+    ('search_region', pa.string()),
+    ('collected_at', pa.string()),
+    ('final_sentiment', pa.string()),
+    ('classification_method', pa.string()),
+    ('positive_keyword_count', pa.int64()),
+    ('negative_keyword_count', pa.int64()),
+])
+
+def videos_to_parquet(videos):
+    """Serialize VideoRecords column by column into a snappy-compressed Parquet file"""
+    columns = {name: [getattr(video, name) for video in videos] for name in VIDEO_SCHEMA.names}
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pydict(columns, schema=VIDEO_SCHEMA), buffer, compression='snappy')
+    return buffer.getvalue()
+
+def gzip_ndjson(records):
+    """Yield gzip-compressed NDJSON chunks, serializing one record at a time"""
+    encoder = msgspec.json.Encoder()
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for record in records:
+        chunk = compressor.compress(encoder.encode(record) + b'\n')
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
 # Configuration class
 class AzureFunctionConfig:
     def __init__(self):
@@ -33,9 +172,17 @@ class AzureFunctionConfig:
         # Sentiment Classification
         self.POSITIVE_KEYWORDS = ['amazing', 'great', 'excellent', 'best', 'awesome']
         self.NEGATIVE_KEYWORDS = ['terrible', 'worst', 'bad', 'awful', 'horrible']
-        self.POSITIVE_CATEGORIES = [28]  # Science & Technology
-        self.NEGATIVE_CATEGORIES = [25]  # News & Politics
-        self.MIXED_CATEGORIES = [22, 23, 24]  # People & Blogs, Comedy, Entertainment
+        self.POSITIVE_CATEGORIES = frozenset({28})  # Science & Technology
+        self.NEGATIVE_CATEGORIES = frozenset({25})  # News & Politics
+        self.MIXED_CATEGORIES = frozenset({22, 23, 24})  # People & Blogs, Comedy, Entertainment
+
+        # One automaton matching every sentiment keyword in a single pass
+        self._ac = ahocorasick.Automaton()
+        for keyword in self.POSITIVE_KEYWORDS:
+            self._ac.add_word(keyword, ('P', keyword))
+        for keyword in self.NEGATIVE_KEYWORDS:
+            self._ac.add_word(keyword, ('N', keyword))
+        self._ac.make_automaton()
     
     def validate(self):
         """Validate required configuration"""
@@ -52,25 +199,46 @@ class AzureFunctionConfig:
 class YouTubeCollectorService:
     def __init__(self, config):
         self.config = config
-        self.youtube = build('youtube', 'v3', developerKey=config.YOUTUBE_API_KEY)
-        self.blob_service = BlobServiceClient.from_connection_string(config.AZURE_CONNECTION_STRING)
-        self.container_client = self.blob_service.get_container_client(config.AZURE_CONTAINER_NAME)
         self.logger = logging.getLogger('YouTubeCollector')
     
-    def search_videos(self, keyword, region_code, max_results=10):
+    async def _get(self, session, resource, **params):
+        """Call a YouTube Data API v3 endpoint and return the decoded JSON"""
+        params['key'] = self.config.YOUTUBE_API_KEY
+        async with session.get(f"{YOUTUBE_API_URL}/{resource}", params=params) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def _list_by_ids(self, session, resource, part, fields, ids):
+        """Fetch resources by id, issuing every 50-id batch concurrently"""
+        responses = await asyncio.gather(*[
+            self._get(session, resource, part=part, fields=fields, id=','.join(ids[i:i+50]))
+            for i in range(0, len(ids), 50)
+        ], return_exceptions=True)
+
+        # A failed batch only drops its own ids; the other batches are kept
+        items = []
+        for response in responses:
+            if isinstance(response, Exception):
+                self.logger.error(f"Error getting {resource} batch: {response}")
+                continue
+            items.extend(response.get('items', []))
+        return items
+
+    async def search_videos(self, session, keyword, region_code, published_after, max_results=10):
         """Search for videos by keyword and region"""
         try:
-            request = self.youtube.search().list(
+            response = await self._get(
+                session, 'search',
                 part='id,snippet',
+                fields=SEARCH_FIELDS,
                 q=keyword,
                 type='video',
                 regionCode=region_code,
                 maxResults=max_results,
                 relevanceLanguage='en',
                 order='relevance',
-                publishedAfter=(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat() + 'Z')
+                publishedAfter=published_after
             )
-            response = request.execute()
             video_ids = []
             for item in response.get('items', []):
                 if item['id']['kind'] == 'youtube#video':
@@ -81,36 +249,18 @@ class YouTubeCollectorService:
             self.logger.error(f"Error searching videos for {keyword} in {region_code}: {e}")
             return []
 
-    def get_video_details(self, video_ids):
+    async def get_video_details(self, session, video_ids):
         """Get detailed information for videos"""
         try:
-            all_videos = []
-            for i in range(0, len(video_ids), 50):
-                batch = video_ids[i:i+50]
-                request = self.youtube.videos().list(
-                    part='snippet,statistics,contentDetails',
-                    id=','.join(batch)
-                )
-                response = request.execute()
-                all_videos.extend(response.get('items', []))
-            return all_videos
+            return await self._list_by_ids(session, 'videos', 'snippet,statistics', VIDEO_FIELDS, video_ids)
         except Exception as e:
             self.logger.error(f"Error getting video details: {e}")
             return []
 
-    def get_channel_details(self, channel_ids):
+    async def get_channel_details(self, session, channel_ids):
         """Get channel information"""
         try:
-            all_channels = []
-            for i in range(0, len(channel_ids), 50):
-                batch = channel_ids[i:i+50]
-                request = self.youtube.channels().list(
-                    part='snippet,statistics',
-                    id=','.join(batch)
-                )
-                response = request.execute()
-                all_channels.extend(response.get('items', []))
-            return all_channels
+            return await self._list_by_ids(session, 'channels', 'snippet,statistics', CHANNEL_FIELDS, channel_ids)
         except Exception as e:
             self.logger.error(f"Error getting channel details: {e}")
             return []
@@ -125,9 +275,10 @@ class YouTubeCollectorService:
         # Combine text
         combined_text = f"{title} {description} {' '.join(tags)}".lower()
         
-        # Count keywords
-        pos_count = sum(1 for word in self.config.POSITIVE_KEYWORDS if word in combined_text)
-        neg_count = sum(1 for word in self.config.NEGATIVE_KEYWORDS if word in combined_text)
+        # Count distinct keywords present, scanning the text once
+        matches = {value for _, value in self.config._ac.iter(combined_text)}
+        pos_count = sum(1 for tag, _ in matches if tag == 'P')
+        neg_count = len(matches) - pos_count
         
         # Classification logic
         if category_id in self.config.POSITIVE_CATEGORIES:
@@ -155,64 +306,81 @@ class YouTubeCollectorService:
             'negative_keyword_count': neg_count
         }
 
-    def calculate_engagement(self, statistics):
-        """Calculate engagement rate"""
-        views = int(statistics.get('viewCount', 0))
-        likes = int(statistics.get('likeCount', 0))
-        comments = int(statistics.get('commentCount', 0))
+    def calculate_engagement(self, video_records):
+        """Calculate engagement rates for a batch of videos in one vectorized pass"""
+        views = np.array([record.view_count for record in video_records], dtype=np.int64)
+        likes = np.array([record.like_count for record in video_records], dtype=np.int64)
+        comments = np.array([record.comment_count for record in video_records], dtype=np.int64)
         
-        if views == 0:
-            return 0.0
-            
-        engagement_rate = ((likes + comments) / views) * 100
-        return round(engagement_rate, 4)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            engagement_rates = np.where(views > 0, np.round(((likes + comments) / views) * 100, 4), 0.0)
+        return engagement_rates.tolist()
 
     def collect_data(self):
         """Main collection function"""
+        return run_async(self._collect_data_async())
+
+    async def _collect_data_async(self):
+        """Run all searches, then all detail lookups, concurrently on one session"""
         self.logger.info("Starting YouTube data collection")
         all_videos = []
-        all_channels = {}
-        
-        for region in self.config.REGIONS:
-            self.logger.info(f"Processing region: {region}")
-            for keyword in self.config.SEARCH_KEYWORDS:
-                self.logger.info(f"Searching for: {keyword} in {region}")
-                video_ids = self.search_videos(keyword, region, self.config.VIDEOS_PER_KEYWORD)
-                
-                if not video_ids:
+        all_channels = set()
+
+        # Snapshot the clock once; every search and record in this run shares it
+        now = datetime.now()
+        published_after = now.replace(hour=0, minute=0, second=0, microsecond=0).isoformat() + 'Z'
+        collected_at = now.isoformat()
+
+        searches = [(region, keyword) for region in self.config.REGIONS for keyword in self.config.SEARCH_KEYWORDS]
+
+        session = get_http_session()
+        search_results = await asyncio.gather(*[
+            self.search_videos(session, keyword, region, published_after, self.config.VIDEOS_PER_KEYWORD)
+            for region, keyword in searches
+        ])
+
+        # Fetch details once per unique video, even if several searches found it
+        unique_ids = list(dict.fromkeys(video_id for video_ids in search_results for video_id in video_ids))
+        details = {video['id']: video for video in await self.get_video_details(session, unique_ids)}
+
+        for (region, keyword), video_ids in zip(searches, search_results):
+            self.logger.info(f"Found {len(video_ids)} videos for {keyword} in {region}")
+
+            for video_id in video_ids:
+                video = details.get(video_id)
+                if video is None:
                     continue
+
+                classification = self.classify_video(video)
                 
-                videos = self.get_video_details(video_ids)
-                
-                for video in videos:
-                    classification = self.classify_video(video)
-                    engagement = self.calculate_engagement(video.get('statistics', {}))
-                    
-                    video_record = {
-                        'video_id': video['id'],
-                        'channel_id': video['snippet']['channelId'],
-                        'category_id': int(video['snippet']['categoryId']),
-                        'title': video['snippet']['title'],
-                        'description': video['snippet'].get('description', ''),
-                        'tags': video['snippet'].get('tags', []),
-                        'published_at': video['snippet']['publishedAt'],
-                        'view_count': int(video['statistics'].get('viewCount', 0)),
-                        'like_count': int(video['statistics'].get('likeCount', 0)),
-                        'comment_count': int(video['statistics'].get('commentCount', 0)),
-                        'engagement_rate': engagement,
-                        'search_keyword': keyword,
-                        'search_region': region,
-                        'collected_at': datetime.now().isoformat(),
-                        **classification
-                    }
-                    all_videos.append(video_record)
-                    all_channels[video['snippet']['channelId']] = None
+                video_record = VideoRecord(
+                    video_id=video['id'],
+                    channel_id=video['snippet']['channelId'],
+                    category_id=int(video['snippet']['categoryId']),
+                    title=video['snippet']['title'],
+                    description=video['snippet'].get('description', ''),
+                    tags=video['snippet'].get('tags', []),
+                    published_at=video['snippet']['publishedAt'],
+                    view_count=int(video['statistics'].get('viewCount', 0)),
+                    like_count=int(video['statistics'].get('likeCount', 0)),
+                    comment_count=int(video['statistics'].get('commentCount', 0)),
+                    engagement_rate=0.0,  # filled in for the whole batch below
+                    search_keyword=keyword,
+                    search_region=region,
+                    collected_at=collected_at,
+                    **classification
+                )
+                all_videos.append(video_record)
+                all_channels.add(video['snippet']['channelId'])
+
+        for video_record, engagement in zip(all_videos, self.calculate_engagement(all_videos)):
+            video_record.engagement_rate = engagement
 
         self.logger.info(f"Collected {len(all_videos)} videos from {len(all_channels)} channels")
-        
+
         # Get channel details
-        channel_ids = list(all_channels.keys())
-        channels = self.get_channel_details(channel_ids)
+        channel_ids = list(all_channels)
+        channels = await self.get_channel_details(session, channel_ids)
         
         channel_records = []
         for channel in channels:
@@ -229,42 +397,48 @@ class YouTubeCollectorService:
     def upload_to_azure(self, videos, channels):
         """Upload data to Azure Blob Storage"""
         try:
-            now = datetime.now()
-            date_path = f"raw/{now.year}/{now.month:02d}/{now.day:02d}"
-            timestamp = now.strftime("%Y%m%d_%H%M%S")
-            
-            # Upload videos
-            videos_blob_name = f"{date_path}/videos_{timestamp}.json"
-            videos_blob = self.container_client.get_blob_client(videos_blob_name)
-            videos_blob.upload_blob(json.dumps(videos, indent=2), overwrite=True)
-            
-            # Upload channels
-            channels_blob_name = f"{date_path}/channels_{timestamp}.json"
-            channels_blob = self.container_client.get_blob_client(channels_blob_name)
-            channels_blob.upload_blob(json.dumps(channels, indent=2), overwrite=True)
-            
-            # Create metadata
-            metadata = {
-                'collection_date': now.strftime('%Y-%m-%d'),
-                'collection_time': now.strftime('%H:%M:%S'),
-                'total_videos': len(videos),
-                'total_channels': len(channels),
-                'regions': self.config.REGIONS,
-                'keywords': self.config.SEARCH_KEYWORDS,
-                'function_execution': True
-            }
-            
-            metadata_blob_name = f"{date_path}/metadata_{timestamp}.json"
-            metadata_blob = self.container_client.get_blob_client(metadata_blob_name)
-            metadata_blob.upload_blob(json.dumps(metadata, indent=2), overwrite=True)
-            
-            self.logger.info(f"Successfully uploaded to Azure: {len(videos)} videos, {len(channels)} channels")
-            return True
-            
+            return run_async(self._upload_to_azure_async(videos, channels))
         except Exception as e:
             self.logger.error(f"Error uploading to Azure: {e}")
             return False
 
+    async def _upload_to_azure_async(self, videos, channels):
+        """Upload the videos, channels and metadata blobs concurrently"""
+        now = datetime.now()
+        date_path = f"raw/{now.year}/{now.month:02d}/{now.day:02d}"
+        timestamp = now.strftime("%Y%m%d_%H%M%S")
+        
+        # Videos go up as Parquet so Snowflake can COPY columnar data; channels are
+        # streamed as gzipped NDJSON, which the stage decompresses and reads per line
+        videos_blob_name = f"{date_path}/videos_{timestamp}.parquet"
+        channels_blob_name = f"{date_path}/channels_{timestamp}.json.gz"
+        metadata_blob_name = f"{date_path}/metadata_{timestamp}.json"
+        
+        # Create metadata
+        metadata = {
+            'collection_date': now.strftime('%Y-%m-%d'),
+            'collection_time': now.strftime('%H:%M:%S'),
+            'total_videos': len(videos),
+            'total_channels': len(channels),
+            'regions': self.config.REGIONS,
+            'keywords': self.config.SEARCH_KEYWORDS,
+            'function_execution': True
+        }
+        
+        blob_service = get_blob_service(self.config.AZURE_CONNECTION_STRING)
+        container_client = blob_service.get_container_client(self.config.AZURE_CONTAINER_NAME)
+        await asyncio.gather(
+            container_client.get_blob_client(videos_blob_name).upload_blob(
+                videos_to_parquet(videos), overwrite=True),
+            container_client.get_blob_client(channels_blob_name).upload_blob(
+                gzip_ndjson(channels), overwrite=True),
+            container_client.get_blob_client(metadata_blob_name).upload_blob(
+                json.dumps(metadata, indent=2), overwrite=True)
+        )
+        
+        self.logger.info(f"Successfully uploaded to Azure: {len(videos)} videos, {len(channels)} channels")
+        return True
+
 class SnowflakeLoaderService:
     def __init__(self, config):
         self.config = config
@@ -280,11 +454,15 @@ class SnowflakeLoaderService:
                 password=self.config.SNOWFLAKE_PASSWORD,
                 account=self.config.SNOWFLAKE_ACCOUNT,
                 warehouse=self.config.SNOWFLAKE_WAREHOUSE,
-                database=self.config.SNOWFLAKE_DATABASE
+                database=self.config.SNOWFLAKE_DATABASE,
+                schema=self.config.SNOWFLAKE_SCHEMA,
+                # Keep the session alive through long loads and download result
+                # chunks on several threads
+                client_session_keep_alive=True,
+                client_prefetch_threads=8,
+                session_parameters={'QUERY_TAG': 'youtube_etl', 'USE_CACHED_RESULT': True}
             )
             self.cursor = self.conn.cursor()
-            self.cursor.execute(f"USE DATABASE {self.config.SNOWFLAKE_DATABASE}")
-            self.cursor.execute(f"USE SCHEMA {self.config.SNOWFLAKE_SCHEMA}")
             self.logger.info("Connected to Snowflake")
             return True
         except Exception as e:
@@ -301,40 +479,21 @@ class SnowflakeLoaderService:
             date_path = f"raw/{today.year}/{today.month:02d}/{today.day:02d}"
             self.logger.info(f"Loading data from: {date_path}")
             
-            # Step 1: Load videos to staging with error handling
-            try:
-                self.logger.info("Loading videos to staging...")
-                self._load_videos_to_staging(date_path)
-                self.conn.commit()  # COMMIT AFTER STAGING
-                self.logger.info("Videos loaded to staging successfully")
-            except Exception as e:
-                self.logger.error(f"FAILED loading videos to staging: {str(e)}")
-                self.conn.rollback()  # Rollback on error
-                return False
-            
-            # Step 2: Load channels with error handling
-            try:
-                self.logger.info("Loading channels...")
-                self._load_channels(date_path)
-                self.conn.commit()  # COMMIT AFTER CHANNELS
-                self.logger.info("Channels loaded successfully")
-            except Exception as e:
-                self.logger.error(f"FAILED loading channels: {str(e)}")
-                self.conn.rollback()  # Rollback on error
-                return False
+            self.ensure_schema()
             
-            # Step 3: Load video facts with error handling
+            # Steps 1-2: Channels and video facts in one multi-statement request
             try:
-                self.logger.info("Loading video facts...")
-                self._load_video_facts()
+                self.logger.info("Loading channels and video facts...")
+                statements = self._load_channels(date_path) + self._load_video_facts(date_path)
+                self.cursor.execute(';\n'.join(statements), num_statements=len(statements))
                 self.conn.commit()  # COMMIT AFTER FACTS
-                self.logger.info("Video facts loaded successfully")
+                self.logger.info("Channels and video facts loaded successfully")
             except Exception as e:
-                self.logger.error(f"FAILED loading video facts: {str(e)}")
+                self.logger.error(f"FAILED loading channels or video facts: {str(e)}")
                 self.conn.rollback()  # Rollback on error
                 return False
             
-            # Step 4: Refresh aggregations (optional - don't fail if this errors)
+            # Step 3: Refresh aggregations (optional - don't fail if this errors)
             try:
                 self.logger.info("Refreshing aggregations...")
                 self._refresh_aggregations()
@@ -344,16 +503,6 @@ class SnowflakeLoaderService:
                 self.logger.error(f"Aggregations failed (non-critical): {str(e)}")
                 self.conn.rollback()
             
-            # Step 5: Cleanup staging (optional - don't fail if this errors)
-            try:
-                self.logger.info("Cleaning up staging...")
-                self._cleanup_staging()
-                self.conn.commit()  # COMMIT AFTER CLEANUP
-                self.logger.info("Staging cleaned up successfully")
-            except Exception as e:
-                self.logger.error(f"Staging cleanup failed (non-critical): {str(e)}")
-                self.conn.rollback()
-            
             self.logger.info("Snowflake loading completed successfully")
             return True
             
@@ -364,56 +513,39 @@ class SnowflakeLoaderService:
         finally:
             self.close()
 
-    def _load_videos_to_staging(self, date_path):
-        """Load videos to staging table"""
-        # Create staging table with FULL DATABASE.SCHEMA path
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS YOUTUBE_ANALYTICS.RAW.STG_VIDEOS (
-                raw_json VARIANT,
-                load_timestamp TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
-                file_name VARCHAR(500)
-            )
-        """)
-        
-        # FIXED: Use fully qualified file format name
-        self.cursor.execute(f"""
-            CREATE OR REPLACE TEMPORARY TABLE TEMP_VIDEOS AS
-            SELECT 
-                value AS raw_json,
-                METADATA$FILENAME AS file_name
-            FROM @YOUTUBE_ANALYTICS.RAW.YOUTUBE_STAGE/{date_path}/ 
-                (FILE_FORMAT => YOUTUBE_ANALYTICS.RAW.MY_JSON_FORMAT),
-                LATERAL FLATTEN(input => $1)
-            WHERE METADATA$FILENAME LIKE '%videos_%'
-        """)
-        
-        # Insert unpacked records with FULL DATABASE.SCHEMA path
-        self.cursor.execute("""
-            INSERT INTO YOUTUBE_ANALYTICS.RAW.STG_VIDEOS (raw_json, file_name)
-            SELECT raw_json, file_name FROM TEMP_VIDEOS
-        """)
+    def ensure_schema(self):
+        """Run the pipeline DDL in one request, once per worker process"""
+        global _schema_initialized
+        if _schema_initialized:
+            return
+        self.cursor.execute(';\n'.join(SCHEMA_DDL), num_statements=len(SCHEMA_DDL))
+        for table, cluster_key in CLUSTER_KEYS:
+            try:
+                self.cursor.execute(f"ALTER TABLE {table} CLUSTER BY ({cluster_key})")
+            except Exception as e:
+                self.logger.warning(f"Left {table} unclustered (non-critical): {e}")
+        _schema_initialized = True
 
     def _load_channels(self, date_path):
-        """Load channel data"""
+        """SQL that loads channel data"""
+        statements = []
         # FIXED: Use fully qualified file format name
-        self.cursor.execute(f"""
+        statements.append(f"""
             CREATE OR REPLACE TEMPORARY TABLE TEMP_CHANNELS AS
             SELECT
-                value:channel_id::VARCHAR as channel_id,
-                value:channel_title::VARCHAR as channel_title,
-                value:channel_country::VARCHAR as channel_country,
-                value:subscriber_count::NUMBER as subscriber_count,
-                value:video_count::NUMBER as video_count
+                $1:channel_id::VARCHAR as channel_id,
+                $1:channel_title::VARCHAR as channel_title,
+                $1:channel_country::VARCHAR as channel_country,
+                $1:subscriber_count::NUMBER as subscriber_count,
+                $1:video_count::NUMBER as video_count
             FROM @YOUTUBE_ANALYTICS.RAW.YOUTUBE_STAGE/{date_path}/ 
-                (FILE_FORMAT => YOUTUBE_ANALYTICS.RAW.MY_JSON_FORMAT),
-                LATERAL FLATTEN(input => $1) t
-            WHERE METADATA$FILENAME LIKE '%channels_%'
-            AND value:channel_id IS NOT NULL
-            QUALIFY ROW_NUMBER() OVER (PARTITION BY value:channel_id ORDER BY METADATA$FILENAME DESC) = 1
+                (FILE_FORMAT => YOUTUBE_ANALYTICS.RAW.MY_JSON_FORMAT, PATTERN => '.*channels_.*')
+            WHERE $1:channel_id IS NOT NULL
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY $1:channel_id ORDER BY METADATA$FILENAME DESC) = 1
         """)
 
         # MERGE into DIM_CHANNELS with FULL DATABASE.SCHEMA path
-        self.cursor.execute("""
+        statements.append("""
             MERGE INTO YOUTUBE_ANALYTICS.CORE.DIM_CHANNELS tgt
             USING TEMP_CHANNELS src
             ON tgt.channel_id = src.channel_id
@@ -432,35 +564,40 @@ class SnowflakeLoaderService:
                 src.subscriber_count, src.video_count, CURRENT_DATE()
             )
         """)
-
-    def _load_video_facts(self):
-        """Load video facts from staging using MERGE to handle duplicates"""
-        # FIXED: Use MERGE instead of INSERT to handle duplicate keys
-        self.cursor.execute("""
+        return statements
+
+    def _load_video_facts(self, date_path):
+        """SQL that merges video facts straight from the staged Parquet files"""
+        statements = []
+        # Insert-only MERGE on video_id: a second run on the same day writes a new
+        # Parquet file holding mostly the same videos, and those must not be re-inserted
+        statements.append(f"""
             MERGE INTO YOUTUBE_ANALYTICS.CORE.FACT_VIDEOS tgt
             USING (
                 SELECT DISTINCT
-                    raw_json:video_id::VARCHAR as video_id,
-                    raw_json:channel_id::VARCHAR as channel_id,
-                    raw_json:category_id::INT as category_id,
-                    raw_json:title::VARCHAR as title,
-                    raw_json:description::TEXT as description,
-                    raw_json:tags::ARRAY as tags,
-                    raw_json:final_sentiment::VARCHAR as final_sentiment,
-                    raw_json:classification_method::VARCHAR as classification_method,
-                    raw_json:positive_keyword_count::INT as positive_keyword_count,
-                    raw_json:negative_keyword_count::INT as negative_keyword_count,
-                    raw_json:view_count::NUMBER as view_count,
-                    raw_json:like_count::NUMBER as like_count,
-                    raw_json:comment_count::NUMBER as comment_count,
-                    raw_json:engagement_rate::FLOAT as engagement_rate,
-                    raw_json:published_at::TIMESTAMP_NTZ as published_at,
-                    raw_json:collected_at::TIMESTAMP_NTZ as collected_at,
-                    DATE(raw_json:collected_at::TIMESTAMP_NTZ) as collection_date,
-                    raw_json:search_keyword::VARCHAR as search_keyword,
-                    raw_json:search_region::VARCHAR as search_region
-                FROM YOUTUBE_ANALYTICS.RAW.STG_VIDEOS
-                WHERE raw_json:video_id IS NOT NULL
+                    $1:video_id::VARCHAR as video_id,
+                    $1:channel_id::VARCHAR as channel_id,
+                    $1:category_id::INT as category_id,
+                    $1:title::VARCHAR as title,
+                    $1:description::TEXT as description,
+                    $1:tags::ARRAY as tags,
+                    $1:final_sentiment::VARCHAR as final_sentiment,
+                    $1:classification_method::VARCHAR as classification_method,
+                    $1:positive_keyword_count::INT as positive_keyword_count,
+                    $1:negative_keyword_count::INT as negative_keyword_count,
+                    $1:view_count::NUMBER as view_count,
+                    $1:like_count::NUMBER as like_count,
+                    $1:comment_count::NUMBER as comment_count,
+                    $1:engagement_rate::FLOAT as engagement_rate,
+                    $1:published_at::TIMESTAMP_NTZ as published_at,
+                    $1:collected_at::TIMESTAMP_NTZ as collected_at,
+                    DATE($1:collected_at::TIMESTAMP_NTZ) as collection_date,
+                    $1:search_keyword::VARCHAR as search_keyword,
+                    $1:search_region::VARCHAR as search_region
+                FROM @YOUTUBE_ANALYTICS.RAW.YOUTUBE_STAGE/{date_path}/
+                    (FILE_FORMAT => YOUTUBE_ANALYTICS.RAW.MY_PARQUET_FORMAT, PATTERN => '.*videos_.*[.]parquet')
+                WHERE $1:video_id IS NOT NULL
+                ORDER BY collection_date, channel_id
             ) src
             ON tgt.video_id = src.video_id
             WHEN NOT MATCHED THEN INSERT (
@@ -480,52 +617,47 @@ class SnowflakeLoaderService:
                 src.search_region
             )
         """)
+        return statements
 
     def _refresh_aggregations(self):
         """Refresh daily aggregations"""
-        # Create schema and table if they don't exist
-        self.cursor.execute("CREATE SCHEMA IF NOT EXISTS YOUTUBE_ANALYTICS.ANALYTICS")
-        
+        # Upsert today's aggregations; only the rows for today are rewritten
         self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION (
-                analysis_date DATE,
-                channel_country VARCHAR(10),
-                final_sentiment VARCHAR(20),
-                video_count NUMBER,
-                total_views NUMBER,
-                total_likes NUMBER,
-                total_comments NUMBER,
-                avg_engagement_rate FLOAT
+            MERGE INTO YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION tgt
+            USING (
+                SELECT 
+                    CURRENT_DATE() as analysis_date,
+                    ch.channel_country,
+                    v.final_sentiment,
+                    COUNT(*) as video_count,
+                    SUM(v.view_count) as total_views,
+                    SUM(v.like_count) as total_likes,
+                    SUM(v.comment_count) as total_comments,
+                    AVG(v.engagement_rate) as avg_engagement_rate
+                FROM YOUTUBE_ANALYTICS.CORE.FACT_VIDEOS v
+                JOIN YOUTUBE_ANALYTICS.CORE.DIM_CHANNELS ch ON v.channel_id = ch.channel_id
+                WHERE v.collection_date = CURRENT_DATE()
+                GROUP BY ch.channel_country, v.final_sentiment
+            ) src
+            ON tgt.analysis_date = src.analysis_date
+                AND tgt.channel_country IS NOT DISTINCT FROM src.channel_country
+                AND tgt.final_sentiment = src.final_sentiment
+            WHEN MATCHED THEN UPDATE SET
+                tgt.video_count = src.video_count,
+                tgt.total_views = src.total_views,
+                tgt.total_likes = src.total_likes,
+                tgt.total_comments = src.total_comments,
+                tgt.avg_engagement_rate = src.avg_engagement_rate
+            WHEN NOT MATCHED THEN INSERT (
+                analysis_date, channel_country, final_sentiment, video_count,
+                total_views, total_likes, total_comments, avg_engagement_rate
+            )
+            VALUES (
+                src.analysis_date, src.channel_country, src.final_sentiment,
+                src.video_count, src.total_views, src.total_likes,
+                src.total_comments, src.avg_engagement_rate
             )
         """)
-        
-        # Delete today's data first
-        self.cursor.execute("""
-            DELETE FROM YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION 
-            WHERE analysis_date = CURRENT_DATE()
-        """)
-        
-        # Insert fresh aggregations
-        self.cursor.execute("""
-            INSERT INTO YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION
-            SELECT 
-                CURRENT_DATE() as analysis_date,
-                ch.channel_country,
-                v.final_sentiment,
-                COUNT(*) as video_count,
-                SUM(v.view_count) as total_views,
-                SUM(v.like_count) as total_likes,
-                SUM(v.comment_count) as total_comments,
-                AVG(v.engagement_rate) as avg_engagement_rate
-            FROM YOUTUBE_ANALYTICS.CORE.FACT_VIDEOS v
-            JOIN YOUTUBE_ANALYTICS.CORE.DIM_CHANNELS ch ON v.channel_id = ch.channel_id
-            WHERE v.collection_date = CURRENT_DATE()
-            GROUP BY ch.channel_country, v.final_sentiment
-        """)
-
-    def _cleanup_staging(self):
-        """Clean up staging table"""
-        self.cursor.execute("TRUNCATE TABLE YOUTUBE_ANALYTICS.RAW.STG_VIDEOS")
 
     def close(self):
         """Close connection"""
@@ -20,6 +20,12 @@ class Config:
     SNOWFLAKE_DATABASE = os.getenv('SNOWFLAKE_DATABASE', 'YOUTUBE_ANALYTICS')
     SNOWFLAKE_SCHEMA = os.getenv('SNOWFLAKE_SCHEMA', 'CORE')
     
+    # Local directory the collector writes Parquet files to for the loader to PUT
+    LOCAL_DATA_DIR = os.getenv('LOCAL_DATA_DIR', 'data')
+    
+    # Channels refreshed in DIM_CHANNELS within this many days are not re-fetched
+    CHANNEL_CACHE_DAYS = int(os.getenv('CHANNEL_CACHE_DAYS', '1'))
+    
     # Classification Keywords
     POSITIVE_KEYWORDS = [
         'tutorial', 'guide', 'learn', 'teach', 'education', 'how-to', 'tips',
@@ -33,10 +39,10 @@ class Config:
         'crisis', 'disaster', 'warning'
     ]
     
-    # Category Classifications
-    POSITIVE_CATEGORIES = [19, 26, 27, 28, 29]
-    NEGATIVE_CATEGORIES = [20, 23, 24, 25]
-    MIXED_CATEGORIES = [1, 2, 10, 15, 17, 22]
+    # Category Classifications (frozensets for constant-time membership checks)
+    POSITIVE_CATEGORIES = frozenset({19, 26, 27, 28, 29})
+    NEGATIVE_CATEGORIES = frozenset({20, 23, 24, 25})
+    MIXED_CATEGORIES = frozenset({1, 2, 10, 15, 17, 22})
     
     # Search Configuration
     REGIONS = ['US', 'IN', 'GB', 'CA', 'AU']
@@ -69,3 +75,11 @@ if Config.DRY_RUN:
     Config.REGIONS = ['US']
     Config.SEARCH_KEYWORDS = ['technology', 'tutorial']
     Config.VIDEOS_PER_KEYWORD = 2
+
+# Module-level bindings for hot paths: a global load is cheaper than a
+# class attribute lookup on every call
+POSITIVE_KEYWORDS = tuple(Config.POSITIVE_KEYWORDS)
+NEGATIVE_KEYWORDS = tuple(Config.NEGATIVE_KEYWORDS)
+POSITIVE_CATEGORIES = Config.POSITIVE_CATEGORIES
+NEGATIVE_CATEGORIES = Config.NEGATIVE_CATEGORIES
+MIXED_CATEGORIES = Config.MIXED_CATEGORIES
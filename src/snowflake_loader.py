@@ -1,6 +1,62 @@
+import glob
+import json
+import os
 import snowflake.connector
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from src.config import Config
+from src.config import (
+    Config, POSITIVE_KEYWORDS, NEGATIVE_KEYWORDS,
+    POSITIVE_CATEGORIES, NEGATIVE_CATEGORIES, MIXED_CATEGORIES
+)
+
+def _quote_files(names):
+    return ', '.join(f"'{name}'" for name in names)
+
+def _keyword_count_sql(keywords):
+    """SQL counting how many distinct keywords appear in video_text"""
+    escaped = (keyword.replace("'", "''") for keyword in keywords)
+    return ' + '.join(f"IFF(CONTAINS(video_text, '{keyword}'), 1, 0)" for keyword in escaped)
+
+def _category_list_sql(categories):
+    return ', '.join(str(category) for category in sorted(categories))
+
+# T_TODAY rows with keyword counts and sentiment derived inline; the text is
+# lowercased once per row (video_text), the same way the collector used to
+CLASSIFIED_VIDEOS_SQL = f"""
+    SELECT
+        v.*,
+        CASE
+            WHEN category_id IN ({_category_list_sql(POSITIVE_CATEGORIES)}) THEN 'POSITIVE'
+            WHEN category_id IN ({_category_list_sql(NEGATIVE_CATEGORIES)}) THEN 'NEGATIVE'
+            WHEN category_id IN ({_category_list_sql(MIXED_CATEGORIES)}) THEN CASE
+                WHEN positive_keyword_count > negative_keyword_count THEN 'POSITIVE'
+                WHEN negative_keyword_count > positive_keyword_count THEN 'NEGATIVE'
+                ELSE 'NEUTRAL'
+            END
+            ELSE 'UNKNOWN'
+        END as final_sentiment,
+        CASE
+            WHEN category_id IN ({_category_list_sql(POSITIVE_CATEGORIES | NEGATIVE_CATEGORIES)}) THEN 'CATEGORY_BASED'
+            WHEN category_id IN ({_category_list_sql(MIXED_CATEGORIES)}) THEN 'KEYWORD_BASED'
+            ELSE 'UNCATEGORIZED'
+        END as classification_method
+    FROM (
+        SELECT
+            video_id, channel_id, category_id, title, description, tags,
+            view_count, like_count, comment_count, engagement_rate,
+            published_at, collected_at, collection_date,
+            search_keyword, search_region,
+            {_keyword_count_sql(POSITIVE_KEYWORDS)} as positive_keyword_count,
+            {_keyword_count_sql(NEGATIVE_KEYWORDS)} as negative_keyword_count
+        FROM (
+            SELECT
+                *,
+                LOWER(title || ' ' || COALESCE(description, '') || ' '
+                      || COALESCE(ARRAY_TO_STRING(tags, ' '), '')) as video_text
+            FROM T_TODAY
+        )
+    ) v
+"""
 
 class SnowflakeLoader:
     def __init__(self):
@@ -10,28 +66,39 @@ class SnowflakeLoader:
             password=Config.SNOWFLAKE_PASSWORD,
             account=Config.SNOWFLAKE_ACCOUNT,
             warehouse=Config.SNOWFLAKE_WAREHOUSE,
-            database=Config.SNOWFLAKE_DATABASE
+            database=Config.SNOWFLAKE_DATABASE,
+            schema=Config.SNOWFLAKE_SCHEMA,
+            # Keep the session alive through long loads and download result
+            # chunks on several threads
+            client_session_keep_alive=True,
+            client_prefetch_threads=8,
+            session_parameters={'QUERY_TAG': 'youtube_etl', 'USE_CACHED_RESULT': True}
         )
         self.cursor = self.conn.cursor()
-        self.cursor.execute(f"USE DATABASE {Config.SNOWFLAKE_DATABASE}")
-        self.cursor.execute(f"USE SCHEMA {Config.SNOWFLAKE_SCHEMA}")
         print("Connected to Snowflake\n")
 
+    def fresh_channel_ids(self, days):
+        """Ids of channels refreshed in DIM_CHANNELS within the last `days` days"""
+        self.cursor.execute("""
+        SELECT channel_id
+        FROM YOUTUBE_ANALYTICS.CORE.DIM_CHANNELS
+        WHERE COALESCE(last_updated, first_seen_date::TIMESTAMP_NTZ) > DATEADD(day, -%s, CURRENT_DATE())
+        """, (days,))
+        return frozenset(row[0] for row in self.cursor)
+
     def load_todays_data(self):
         today = datetime.now()
         date_path = f"raw/{today.year}/{today.month:02d}/{today.day:02d}"
         print(f"Loading data from: {date_path}\n")
         try:
-            print("Step 1: Loading videos to staging...")
-            self.load_videos_to_staging(date_path)
+            print("Step 1: Staging files...")
+            staged = self.stage_files(date_path)
             print("Step 2: Loading channels...")
-            self.load_channels(date_path)
-            print("Step 3: Loading video facts...")
-            self.load_video_facts()
-            print("Step 4: Refreshing aggregations...")
-            self.refresh_aggregations()
-            print("Step 5: Cleaning up staging...")
-            self.cleanup_staging()
+            self.load_channels(date_path, staged['channels'])
+            print("Step 3: Loading video facts and aggregations...")
+            self.load_video_facts(date_path, staged['videos'])
+            print("Step 4: Cleaning up staging...")
+            self.cleanup_staging(date_path)
             print("\nSnowflake loading completed successfully!\n")
             self.print_summary()
             return True
@@ -39,53 +106,77 @@ class SnowflakeLoader:
             print(f"\n Error loading to Snowflake: {e}\n")
             return False
 
-    def load_videos_to_staging(self, date_path):
-        # 1. Create the staging table if not exists
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS RAW.STG_VIDEOS (
-                raw_json VARIANT,
-                load_timestamp TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
-                file_name VARCHAR(500)
-            )
-        """)
-        # 2. Create a temp table using FLATTEN to unpack the JSON array
-        self.cursor.execute(f"""
-            CREATE OR REPLACE TEMPORARY TABLE TEMP_VIDEOS AS
-            SELECT 
-                value AS raw_json,
-                METADATA$FILENAME AS file_name
-            FROM @YOUTUBE_ANALYTICS.RAW.AZURE_STAGE/{date_path}/ (FILE_FORMAT => 'MY_JSON_FORMAT'),
-                LATERAL FLATTEN(input => $1)
-            WHERE METADATA$FILENAME LIKE '%videos_%'
-        """)
-        # 3. Insert unpacked records into staging table
+    def stage_files(self, date_path):
+        # 1. Internal stage that holds the collector's Parquet files
         self.cursor.execute("""
-            INSERT INTO RAW.STG_VIDEOS (raw_json, file_name)
-            SELECT raw_json, file_name FROM TEMP_VIDEOS
+            CREATE STAGE IF NOT EXISTS YOUTUBE_ANALYTICS.RAW.INT_STAGE
+            FILE_FORMAT = (TYPE = PARQUET)
         """)
-        print("Videos loaded to staging.")
+        # 2. One PUT per file, each on its own cursor; Parquet is already
+        #    snappy-compressed, so no gzip on top
+        local_dir = os.path.abspath(os.path.join(Config.LOCAL_DATA_DIR, date_path))
+        paths = sorted(glob.glob(os.path.join(local_dir, '*.parquet')))
+        if not paths:
+            raise FileNotFoundError(f"No Parquet files found in {local_dir}")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda path: self._put_file(path, date_path), paths))
 
+        names = [os.path.basename(path) for path in paths]
+        staged = {
+            'videos': [name for name in names if name.startswith('videos_')],
+            'channels': [name for name in names if name.startswith('channels_')]
+        }
+        print(f"Staged {len(staged['videos'])} video and {len(staged['channels'])} channel files.")
+        return staged
 
-    def load_channels(self, date_path):
+    def _put_file(self, path, date_path):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+                PUT 'file://{path}' @YOUTUBE_ANALYTICS.RAW.INT_STAGE/{date_path}/
+                AUTO_COMPRESS = FALSE OVERWRITE = TRUE
+            """)
+        finally:
+            cursor.close()
+
+    def load_channels(self, date_path, files):
+        # FILES = () is a syntax error, so there is nothing to run without files
+        if not files:
+            print("No channel files staged; skipping channel merge.")
+            return
+        self.cursor.execute("""
+        CREATE OR REPLACE TEMPORARY TABLE TEMP_CHANNELS (
+            channel_id VARCHAR,
+            channel_title VARCHAR,
+            channel_country VARCHAR,
+            subscriber_count NUMBER,
+            video_count NUMBER,
+            file_name VARCHAR(500)
+        )
+        """)
         self.cursor.execute(f"""
-        CREATE OR REPLACE TEMPORARY TABLE TEMP_CHANNELS AS
-        SELECT
-            value:channel_id::VARCHAR as channel_id,
-            value:channel_title::VARCHAR as channel_title,
-            value:channel_country::VARCHAR as channel_country,
-            value:subscriber_count::NUMBER as subscriber_count,
-            value:video_count::NUMBER as video_count
-        FROM @YOUTUBE_ANALYTICS.RAW.AZURE_STAGE/{date_path}/ (FILE_FORMAT => 'MY_JSON_FORMAT'),
-            LATERAL FLATTEN(input => $1) t
-        WHERE METADATA$FILENAME LIKE '%channels_%'
-        AND value:channel_id IS NOT NULL
-        QUALIFY ROW_NUMBER() OVER (PARTITION BY value:channel_id ORDER BY METADATA$FILENAME DESC) = 1
-    """)
+        COPY INTO TEMP_CHANNELS
+        FROM (
+            SELECT
+                $1:channel_id::VARCHAR,
+                $1:channel_title::VARCHAR,
+                $1:channel_country::VARCHAR,
+                $1:subscriber_count::NUMBER,
+                $1:video_count::NUMBER,
+                METADATA$FILENAME
+            FROM @YOUTUBE_ANALYTICS.RAW.INT_STAGE/{date_path}/
+        )
+        FILES = ({_quote_files(files)})
+        """)
 
 
         self.cursor.execute("""
         MERGE INTO YOUTUBE_ANALYTICS.CORE.DIM_CHANNELS tgt
-        USING TEMP_CHANNELS src
+        USING (
+            SELECT * FROM TEMP_CHANNELS
+            WHERE channel_id IS NOT NULL
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY file_name DESC) = 1
+        ) src
         ON tgt.channel_id = src.channel_id
         WHEN MATCHED THEN UPDATE SET
             tgt.channel_title = src.channel_title,
@@ -104,92 +195,168 @@ class SnowflakeLoader:
         """)
         print("Channel merge completed.")
 
-    def load_video_facts(self):
+    def load_video_facts(self, date_path, files):
+        # A run whose searches all failed stages a channels file but no videos
+        if not files:
+            print("No video files staged; skipping video facts and aggregations.")
+            return
+        # Today's staged rows are read once into T_TODAY and merged into
+        # FACT_VIDEOS; the rollup then reads all of today's FACT_VIDEOS rows
+        # (pruned by its collection_date cluster key), not just this run's
         self.cursor.execute("""
-        INSERT INTO YOUTUBE_ANALYTICS.CORE.FACT_VIDEOS
-        SELECT 
-            raw_json:video_id::VARCHAR,
-            raw_json:channel_id::VARCHAR,
-            raw_json:category_id::INT,
-            raw_json:title::VARCHAR,
-            raw_json:description::TEXT,
-            raw_json:tags::ARRAY,
-            raw_json:final_sentiment::VARCHAR,
-            raw_json:classification_method::VARCHAR,
-            raw_json:positive_keyword_count::INT,
-            raw_json:negative_keyword_count::INT,
-            raw_json:view_count::NUMBER,
-            raw_json:like_count::NUMBER,
-            raw_json:comment_count::NUMBER,
-            raw_json:engagement_rate::FLOAT,
-            raw_json:published_at::TIMESTAMP_NTZ,
-            raw_json:collected_at::TIMESTAMP_NTZ,
-            DATE(raw_json:collected_at::TIMESTAMP_NTZ),
-            raw_json:search_keyword::VARCHAR,
-            raw_json:search_region::VARCHAR
-        FROM YOUTUBE_ANALYTICS.RAW.STG_VIDEOS
-        WHERE raw_json:video_id IS NOT NULL
+        CREATE OR REPLACE TEMPORARY TABLE T_TODAY
+        LIKE YOUTUBE_ANALYTICS.CORE.FACT_VIDEOS
         """)
-        print("Videos loaded to fact table.")
+        self.cursor.execute(f"""
+        COPY INTO T_TODAY (
+            video_id, channel_id, category_id, title, description, tags,
+            view_count, like_count, comment_count,
+            engagement_rate, published_at, collected_at, collection_date,
+            search_keyword, search_region
+        )
+        FROM (
+            SELECT 
+                $1:video_id::VARCHAR,
+                $1:channel_id::VARCHAR,
+                $1:category_id::INT,
+                $1:title::VARCHAR,
+                $1:description::TEXT,
+                $1:tags::ARRAY,
+                $1:view_count::NUMBER,
+                $1:like_count::NUMBER,
+                $1:comment_count::NUMBER,
+                $1:engagement_rate::FLOAT,
+                $1:published_at::TIMESTAMP_NTZ,
+                $1:collected_at::TIMESTAMP_NTZ,
+                $1:collected_at::TIMESTAMP_NTZ::DATE,
+                $1:search_keyword::VARCHAR,
+                $1:search_region::VARCHAR
+            FROM @YOUTUBE_ANALYTICS.RAW.INT_STAGE/{date_path}/
+        )
+        FILES = ({_quote_files(files)})
+        ON_ERROR = CONTINUE
+        """)
+        self.cursor.execute("BEGIN")
+        try:
+            # Earlier runs today already loaded some of these files, so only
+            # rows FACT_VIDEOS does not have yet are inserted, classified on the way
+            self.cursor.execute(f"""
+            MERGE INTO YOUTUBE_ANALYTICS.CORE.FACT_VIDEOS tgt
+            USING (
+                {CLASSIFIED_VIDEOS_SQL}
+                ORDER BY collection_date, channel_id
+            ) src
+            ON tgt.collection_date = src.collection_date
+                AND tgt.video_id = src.video_id
+                AND tgt.search_region = src.search_region
+                AND tgt.search_keyword = src.search_keyword
+                AND tgt.collected_at = src.collected_at
+            WHEN NOT MATCHED THEN INSERT (
+                video_id, channel_id, category_id, title, description, tags,
+                final_sentiment, classification_method, positive_keyword_count,
+                negative_keyword_count, view_count, like_count, comment_count,
+                engagement_rate, published_at, collected_at, collection_date,
+                search_keyword, search_region
+            )
+            VALUES (
+                src.video_id, src.channel_id, src.category_id, src.title,
+                src.description, src.tags, src.final_sentiment,
+                src.classification_method, src.positive_keyword_count,
+                src.negative_keyword_count, src.view_count, src.like_count,
+                src.comment_count, src.engagement_rate, src.published_at,
+                src.collected_at, src.collection_date, src.search_keyword,
+                src.search_region
+            )
+            """)
+            print("Videos loaded to fact table.")
+            self.refresh_aggregations()
+            self.cursor.execute("COMMIT")
+        except Exception:
+            self.cursor.execute("ROLLBACK")
+            raise
 
     def refresh_aggregations(self):
         self.cursor.execute("""
-        DELETE FROM YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION 
-        WHERE analysis_date = CURRENT_DATE()
-        """)
-        self.cursor.execute("""
-        INSERT INTO YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION
-        SELECT 
-            CURRENT_DATE() as analysis_date,
-            ch.channel_country,
-            v.final_sentiment,
-            COUNT(*) as video_count,
-            SUM(v.view_count) as total_views,
-            SUM(v.like_count) as total_likes,
-            SUM(v.comment_count) as total_comments,
-            AVG(v.engagement_rate) as avg_engagement_rate
-        FROM YOUTUBE_ANALYTICS.CORE.FACT_VIDEOS v
-        JOIN YOUTUBE_ANALYTICS.CORE.DIM_CHANNELS ch ON v.channel_id = ch.channel_id
-        WHERE v.collection_date = CURRENT_DATE()
-        GROUP BY ch.channel_country, v.final_sentiment
+        MERGE INTO YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION tgt
+        USING (
+            SELECT 
+                CURRENT_DATE() as analysis_date,
+                ch.channel_country,
+                v.final_sentiment,
+                COUNT(*) as video_count,
+                SUM(v.view_count) as total_views,
+                SUM(v.like_count) as total_likes,
+                SUM(v.comment_count) as total_comments,
+                AVG(v.engagement_rate) as avg_engagement_rate
+            FROM YOUTUBE_ANALYTICS.CORE.FACT_VIDEOS v
+            JOIN YOUTUBE_ANALYTICS.CORE.DIM_CHANNELS ch ON v.channel_id = ch.channel_id
+            WHERE v.collection_date = CURRENT_DATE()
+            GROUP BY ch.channel_country, v.final_sentiment
+        ) src
+        ON tgt.analysis_date = src.analysis_date
+            AND tgt.channel_country IS NOT DISTINCT FROM src.channel_country
+            AND tgt.final_sentiment = src.final_sentiment
+        WHEN MATCHED THEN UPDATE SET
+            tgt.video_count = src.video_count,
+            tgt.total_views = src.total_views,
+            tgt.total_likes = src.total_likes,
+            tgt.total_comments = src.total_comments,
+            tgt.avg_engagement_rate = src.avg_engagement_rate
+        WHEN NOT MATCHED THEN INSERT (
+            analysis_date, channel_country, final_sentiment, video_count,
+            total_views, total_likes, total_comments, avg_engagement_rate
+        )
+        VALUES (
+            src.analysis_date, src.channel_country, src.final_sentiment,
+            src.video_count, src.total_views, src.total_likes,
+            src.total_comments, src.avg_engagement_rate
+        )
         """)
         print("Aggregations refreshed.")
 
-    def cleanup_staging(self):
-        self.cursor.execute("TRUNCATE TABLE YOUTUBE_ANALYTICS.RAW.STG_VIDEOS")
-        print(" Staging table cleaned.")
+    def cleanup_staging(self, date_path):
+        self.cursor.execute(f"REMOVE @YOUTUBE_ANALYTICS.RAW.INT_STAGE/{date_path}/")
+        print(" Staged files removed.")
 
     def print_summary(self):
         print(f"{'='*60}")
         print("SNOWFLAKE DATA SUMMARY")
         print(f"{'='*60}\n")
+        # Totals (section 0) and one row per region with today's breakdown
+        # already grouped by Snowflake (section 1), in one round trip
         self.cursor.execute("""
-        SELECT 
+        SELECT
+            0 as section,
+            NULL as channel_country,
+            NULL as sentiments,
             (SELECT COUNT(*) FROM YOUTUBE_ANALYTICS.CORE.DIM_CHANNELS) as channels,
             (SELECT COUNT(*) FROM YOUTUBE_ANALYTICS.CORE.FACT_VIDEOS) as videos,
             (SELECT COUNT(*) FROM YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION) as aggregations
-        """)
-        result = self.cursor.fetchone()
-        print(f"Total Records:")
-        print(f"   Channels:     {result[0]:,}")
-        print(f"   Videos:       {result[1]:,}")
-        print(f"   Aggregations: {result[2]:,}")
-        self.cursor.execute("""
+        UNION ALL
         SELECT 
+            1,
             channel_country,
-            final_sentiment,
-            video_count
+            ARRAY_AGG(OBJECT_CONSTRUCT('sentiment', final_sentiment, 'count', video_count))
+                WITHIN GROUP (ORDER BY video_count DESC),
+            NULL,
+            NULL,
+            NULL
         FROM YOUTUBE_ANALYTICS.ANALYTICS.AGG_DAILY_BY_REGION
         WHERE analysis_date = CURRENT_DATE()
-        ORDER BY channel_country, video_count DESC
+        GROUP BY channel_country
+        ORDER BY 1, 2
         """)
-        print(f"\n Today's Sentiment by Region:")
-        current_region = None
-        for row in self.cursor:
-            if row[0] != current_region:
-                current_region = row[0]
-                print(f"\n   {row[0]}:")
-            print(f"      {row[1]:12} {row[2]:4} videos")
+        for section, region, sentiments, channels, videos, aggregations in self.cursor.fetchall():
+            if section == 0:
+                print(f"Total Records:")
+                print(f"   Channels:     {channels:,}")
+                print(f"   Videos:       {videos:,}")
+                print(f"   Aggregations: {aggregations:,}")
+                print(f"\n Today's Sentiment by Region:")
+                continue
+            print(f"\n   {region}:")
+            for entry in json.loads(sentiments):
+                print(f"      {entry['sentiment']:12} {entry['count']:4} videos")
         print(f"\n{'='*60}\n")
 
     def close(self):
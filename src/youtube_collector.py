@@ -1,20 +1,88 @@
+import asyncio
+import io
 import json
+import os
 from datetime import datetime
-from googleapiclient.discovery import build
+import aiohttp
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from azure.storage.blob import BlobServiceClient
 from src.config import Config
+from src.snowflake_loader import SnowflakeLoader
+
+YOUTUBE_API_URL = 'https://www.googleapis.com/youtube/v3'
+
+# Partial-response masks: the API only returns the fields the pipeline reads
+SEARCH_FIELDS = 'items(id(kind,videoId))'
+VIDEO_FIELDS = ('items(id,snippet(channelId,categoryId,title,description,tags,publishedAt),'
+                'statistics(viewCount,likeCount,commentCount))')
+CHANNEL_FIELDS = 'items(id,snippet(title,country),statistics(subscriberCount,videoCount))'
+
+# Parquet layouts of the files handed to the Snowflake loader
+VIDEO_SCHEMA = pa.schema([
+    ('video_id', pa.string()),
+    ('channel_id', pa.string()),
+    ('category_id', pa.int64()),
+    ('title', pa.string()),
+    ('description', pa.string()),
+    ('tags', pa.list_(pa.string())),
+    ('published_at', pa.string()),
+    ('view_count', pa.int64()),
+    ('like_count', pa.int64()),
+    ('comment_count', pa.int64()),
+    ('engagement_rate', pa.float64()),
+    ('search_keyword', pa.string()),
+    ('search_region', pa.string()),
+    ('collected_at', pa.string()),
+])
+
+CHANNEL_SCHEMA = pa.schema([
+    ('channel_id', pa.string()),
+    ('channel_title', pa.string()),
+    ('channel_country', pa.string()),
+    ('subscriber_count', pa.int64()),
+    ('video_count', pa.int64()),
+])
 
 class YouTubeCollector:
-    def __init__(self):
-        self.youtube = build('youtube', 'v3', developerKey=Config.YOUTUBE_API_KEY)
+    def __init__(self, fresh_channels=frozenset()):
+        # Channels already up to date in Snowflake; their details are not fetched again
+        self.fresh_channels = fresh_channels
         self.blob_service = BlobServiceClient.from_connection_string(Config.AZURE_CONNECTION_STRING)
         self.container_client = self.blob_service.get_container_client(Config.AZURE_CONTAINER_NAME)
     
-    def search_videos(self, keyword, region_code, max_results=10):
+    async def _get(self, session, resource, **params):
+        """Call a YouTube Data API v3 endpoint and return the decoded JSON"""
+        params['key'] = Config.YOUTUBE_API_KEY
+        async with session.get(f"{YOUTUBE_API_URL}/{resource}", params=params) as response:
+            response.raise_for_status()
+            return await response.json()
+    
+    async def _list_by_ids(self, session, resource, fields, ids):
+        """Fetch resources by id, issuing every 50-id batch concurrently"""
+        responses = await asyncio.gather(*[
+            self._get(session, resource, part='snippet,statistics', fields=fields, id=','.join(ids[i:i+50]))
+            for i in range(0, len(ids), 50)
+        ], return_exceptions=True)
+        
+        # A failed batch only drops its own ids; the other batches are kept
+        items = []
+        for response in responses:
+            if isinstance(response, Exception):
+                print(f"Error getting {resource} batch: {response}")
+                continue
+            items.extend(response.get('items', []))
+        return items
+    
+    async def search_videos(self, session, keyword, region_code, max_results=10):
         """Search for videos by keyword and region"""
         try:
-            request = self.youtube.search().list(
+            response = await self._get(
+                session, 'search',
                 part='id,snippet',
+                fields=SEARCH_FIELDS,
                 q=keyword,
                 type='video',
                 regionCode=region_code,
@@ -22,7 +90,6 @@ class YouTubeCollector:
                 relevanceLanguage='en',
                 order='relevance'
             )
-            response = request.execute()
             
             video_ids = []
             for item in response.get('items', []):
@@ -35,74 +102,24 @@ class YouTubeCollector:
             print(f"Error searching videos: {e}")
             return []
     
-    def get_video_details(self, video_ids):
+    async def get_video_details(self, session, video_ids):
         """Get detailed information for videos"""
         try:
-            request = self.youtube.videos().list(
-                part='snippet,statistics,contentDetails',
-                id=','.join(video_ids)
-            )
-            response = request.execute()
-            return response.get('items', [])
+            return await self._list_by_ids(session, 'videos', VIDEO_FIELDS, video_ids)
         
         except Exception as e:
             print(f"Error getting video details: {e}")
             return []
     
-    def get_channel_details(self, channel_ids):
+    async def get_channel_details(self, session, channel_ids):
         """Get channel information"""
         try:
-            request = self.youtube.channels().list(
-                part='snippet,statistics',
-                id=','.join(channel_ids)
-            )
-            response = request.execute()
-            return response.get('items', [])
+            return await self._list_by_ids(session, 'channels', CHANNEL_FIELDS, channel_ids)
         
         except Exception as e:
             print(f"Error getting channel details: {e}")
             return []
     
-    def classify_video(self, video_data):
-        """Classify video sentiment"""
-        category_id = int(video_data['snippet']['categoryId'])
-        title = video_data['snippet']['title']
-        description = video_data['snippet'].get('description', '')
-        tags = video_data['snippet'].get('tags', [])
-        
-        # Combine text
-        combined_text = f"{title} {description} {' '.join(tags)}".lower()
-        
-        # Count keywords
-        pos_count = sum(1 for word in Config.POSITIVE_KEYWORDS if word in combined_text)
-        neg_count = sum(1 for word in Config.NEGATIVE_KEYWORDS if word in combined_text)
-        
-        # Classification logic
-        if category_id in Config.POSITIVE_CATEGORIES:
-            sentiment = 'POSITIVE'
-            method = 'CATEGORY_BASED'
-        elif category_id in Config.NEGATIVE_CATEGORIES:
-            sentiment = 'NEGATIVE'
-            method = 'CATEGORY_BASED'
-        elif category_id in Config.MIXED_CATEGORIES:
-            if pos_count > neg_count:
-                sentiment = 'POSITIVE'
-            elif neg_count > pos_count:
-                sentiment = 'NEGATIVE'
-            else:
-                sentiment = 'NEUTRAL'
-            method = 'KEYWORD_BASED'
-        else:
-            sentiment = 'UNKNOWN'
-            method = 'UNCATEGORIZED'
-        
-        return {
-            'final_sentiment': sentiment,
-            'classification_method': method,
-            'positive_keyword_count': pos_count,
-            'negative_keyword_count': neg_count
-        }
-    
     def calculate_engagement(self, statistics):
         """Calculate engagement rate"""
         views = int(statistics.get('viewCount', 0))
@@ -115,8 +132,28 @@ class YouTubeCollector:
         engagement_rate = ((likes + comments) / views) * 100
         return round(engagement_rate, 4)
     
+    async def _search_all(self, session, searches):
+        """Run every search at once, then fetch details once per unique video"""
+        search_results = await asyncio.gather(*[
+            self.search_videos(session, keyword, region, Config.VIDEOS_PER_KEYWORD)
+            for region, keyword in searches
+        ])
+        unique_ids = list(dict.fromkeys(video_id for video_ids in search_results for video_id in video_ids))
+        details = {video['id']: video for video in await self.get_video_details(session, unique_ids)}
+        return search_results, details
+    
     def collect_data(self):
         """Main collection function"""
+        return asyncio.run(self._collect_data_async())
+    
+    async def _collect_data_async(self):
+        """Collect videos and channels over one pooled HTTPS session"""
+        # Cap in-flight requests to stay friendly with the YouTube quota
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=20)) as session:
+            return await self._collect_with_session(session)
+    
+    async def _collect_with_session(self, session):
+        """Search and fetch video and channel details on the given session"""
         print(f"\n{'='*60}")
         print(f"Starting YouTube Data Collection")
         print(f"Time: {datetime.now()}")
@@ -125,75 +162,74 @@ class YouTubeCollector:
         if Config.DRY_RUN:
             print("⚠️  DRY RUN MODE - Collecting limited data for testing\n")
         
-        all_videos = []
+        # Videos are built column by column, one list per VIDEO_SCHEMA field
+        columns = {name: [] for name in VIDEO_SCHEMA.names}
         all_channels = {}
         
+        # One timestamp for the whole run instead of one per video
+        collected_at = datetime.now().isoformat()
+        
+        searches = [(region, keyword) for region in Config.REGIONS for keyword in Config.SEARCH_KEYWORDS]
+        search_results, details = await self._search_all(session, searches)
+        results = dict(zip(searches, search_results))
+        
         # Collect videos
         for region in Config.REGIONS:
             print(f"📍 Region: {region}")
             
             for keyword in Config.SEARCH_KEYWORDS:
-                print(f"   🔍 Searching: '{keyword}'", end='')
-                
-                video_ids = self.search_videos(keyword, region, Config.VIDEOS_PER_KEYWORD)
-                print(f" → Found {len(video_ids)} videos")
-                
-                if not video_ids:
-                    continue
-                
-                # Get video details
-                videos = self.get_video_details(video_ids)
+                video_ids = results[(region, keyword)]
+                print(f"   🔍 Searching: '{keyword}' → Found {len(video_ids)} videos")
                 
                 # Process each video
-                for video in videos:
-                    classification = self.classify_video(video)
+                for video_id in video_ids:
+                    video = details.get(video_id)
+                    if video is None:
+                        continue
+                    
                     engagement = self.calculate_engagement(video.get('statistics', {}))
                     
-                    video_record = {
-                        'video_id': video['id'],
-                        'channel_id': video['snippet']['channelId'],
-                        'category_id': int(video['snippet']['categoryId']),
-                        'title': video['snippet']['title'],
-                        'description': video['snippet'].get('description', ''),
-                        'tags': video['snippet'].get('tags', []),
-                        'published_at': video['snippet']['publishedAt'],
-                        'view_count': int(video['statistics'].get('viewCount', 0)),
-                        'like_count': int(video['statistics'].get('likeCount', 0)),
-                        'comment_count': int(video['statistics'].get('commentCount', 0)),
-                        'engagement_rate': engagement,
-                        'search_keyword': keyword,
-                        'search_region': region,
-                        'collected_at': datetime.now().isoformat(),
-                        **classification
-                    }
+                    columns['video_id'].append(video['id'])
+                    columns['channel_id'].append(video['snippet']['channelId'])
+                    columns['category_id'].append(int(video['snippet']['categoryId']))
+                    columns['title'].append(video['snippet']['title'])
+                    columns['description'].append(video['snippet'].get('description', ''))
+                    columns['tags'].append(video['snippet'].get('tags', []))
+                    columns['published_at'].append(video['snippet']['publishedAt'])
+                    columns['view_count'].append(int(video['statistics'].get('viewCount', 0)))
+                    columns['like_count'].append(int(video['statistics'].get('likeCount', 0)))
+                    columns['comment_count'].append(int(video['statistics'].get('commentCount', 0)))
+                    columns['engagement_rate'].append(engagement)
+                    columns['search_keyword'].append(keyword)
+                    columns['search_region'].append(region)
+                    columns['collected_at'].append(collected_at)
                     
-                    all_videos.append(video_record)
                     all_channels[video['snippet']['channelId']] = None
             
             print()
         
-        print(f"Collected {len(all_videos)} videos from {len(all_channels)} channels\n")
+        all_videos = pa.Table.from_pydict(columns, schema=VIDEO_SCHEMA)
+        print(f"Collected {all_videos.num_rows} videos from {len(all_channels)} channels\n")
         
         # Get channel details
         print("📺 Fetching channel details...")
-        channel_ids = list(all_channels.keys())
+        channel_ids = [channel_id for channel_id in all_channels if channel_id not in self.fresh_channels]
+        channels = await self.get_channel_details(session, channel_ids) if channel_ids else []
         
-        for i in range(0, len(channel_ids), 50):
-            batch = channel_ids[i:i+50]
-            channels = self.get_channel_details(batch)
-            
-            for channel in channels:
-                all_channels[channel['id']] = {
-                    'channel_id': channel['id'],
-                    'channel_title': channel['snippet']['title'],
-                    'channel_country': channel['snippet'].get('country', 'UNKNOWN'),
-                    'subscriber_count': int(channel['statistics'].get('subscriberCount', 0)),
-                    'video_count': int(channel['statistics'].get('videoCount', 0))
-                }
+        for channel in channels:
+            all_channels[channel['id']] = {
+                'channel_id': channel['id'],
+                'channel_title': channel['snippet']['title'],
+                'channel_country': channel['snippet'].get('country', 'UNKNOWN'),
+                'subscriber_count': int(channel['statistics'].get('subscriberCount', 0)),
+                'video_count': int(channel['statistics'].get('videoCount', 0))
+            }
         
-        print(f"Fetched details for {len(all_channels)} channels\n")
+        print(f"Fetched details for {len(channels)} channels "
+              f"({len(all_channels) - len(channel_ids)} still fresh in Snowflake)\n")
         
-        return all_videos, list(all_channels.values())
+        # Fresh channels stay None and are left out; Snowflake already has them
+        return all_videos, [channel for channel in all_channels.values() if channel is not None]
     
     def upload_to_azure(self, videos, channels):
         """Upload data to Azure Blob Storage"""
@@ -206,22 +242,26 @@ class YouTubeCollector:
             timestamp = now.strftime("%Y%m%d_%H%M%S")
             
             # Upload videos
-            videos_blob_name = f"{date_path}/videos_{timestamp}.json"
+            videos_blob_name = f"{date_path}/videos_{timestamp}.parquet"
             videos_blob = self.container_client.get_blob_client(videos_blob_name)
-            videos_blob.upload_blob(json.dumps(videos, indent=2), overwrite=True)
+            buffer = io.BytesIO()
+            pq.write_table(videos, buffer, compression='snappy')
+            payload = buffer.getvalue()
+            videos_blob.upload_blob(payload, overwrite=True, length=len(payload), max_concurrency=8)
             print(f"Videos: {videos_blob_name}")
             
             # Upload channels
             channels_blob_name = f"{date_path}/channels_{timestamp}.json"
             channels_blob = self.container_client.get_blob_client(channels_blob_name)
-            channels_blob.upload_blob(json.dumps(channels, indent=2), overwrite=True)
+            payload = orjson.dumps(channels)
+            channels_blob.upload_blob(payload, overwrite=True, length=len(payload), max_concurrency=8)
             print(f"Channels: {channels_blob_name}")
             
             # Create metadata
             metadata = {
                 'collection_date': now.strftime('%Y-%m-%d'),
                 'collection_time': now.strftime('%H:%M:%S'),
-                'total_videos': len(videos),
+                'total_videos': videos.num_rows,
                 'total_channels': len(channels),
                 'regions': Config.REGIONS,
                 'keywords': Config.SEARCH_KEYWORDS
@@ -238,28 +278,52 @@ class YouTubeCollector:
             print(f"Error uploading to Azure: {e}")
             return False
     
+    def write_parquet_files(self, videos, channels):
+        """Write one Parquet file per region plus a channels file under LOCAL_DATA_DIR"""
+        print("💾 Writing Parquet files for the Snowflake loader...")
+        
+        try:
+            now = datetime.now()
+            date_path = f"raw/{now.year}/{now.month:02d}/{now.day:02d}"
+            timestamp = now.strftime("%Y%m%d_%H%M%S")
+            local_dir = os.path.join(Config.LOCAL_DATA_DIR, date_path)
+            os.makedirs(local_dir, exist_ok=True)
+            
+            # Independent files let the loader PUT them in parallel
+            paths = []
+            for region in Config.REGIONS:
+                region_videos = videos.filter(pc.equal(videos['search_region'], region))
+                if region_videos.num_rows == 0:
+                    continue
+                path = os.path.join(local_dir, f"videos_{timestamp}_{region}.parquet")
+                pq.write_table(region_videos, path, compression='snappy')
+                paths.append(path)
+            
+            path = os.path.join(local_dir, f"channels_{timestamp}.parquet")
+            pq.write_table(pa.Table.from_pylist(channels, schema=CHANNEL_SCHEMA), path, compression='snappy')
+            paths.append(path)
+            
+            for path in paths:
+                print(f"Parquet: {path}")
+            return True
+        
+        except Exception as e:
+            print(f"Error writing Parquet files: {e}")
+            return False
+    
+    @staticmethod
+    def _value_counts(column):
+        """Count each distinct value of a table column"""
+        return {item['values']: item['counts'] for item in column.value_counts().to_pylist()}
+    
     def print_summary(self, videos):
         """Print collection summary"""
         print(f"\n{'='*60}")
         print("COLLECTION SUMMARY")
         print(f"{'='*60}")
         
-        # Sentiment distribution
-        sentiment_counts = {}
-        for video in videos:
-            sentiment = video['final_sentiment']
-            sentiment_counts[sentiment] = sentiment_counts.get(sentiment, 0) + 1
-        
-        print("\n Sentiment Distribution:")
-        for sentiment, count in sorted(sentiment_counts.items()):
-            percentage = (count / len(videos)) * 100
-            print(f"   {sentiment:12} {count:4} ({percentage:5.1f}%)")
-        
         # Region distribution
-        region_counts = {}
-        for video in videos:
-            region = video['search_region']
-            region_counts[region] = region_counts.get(region, 0) + 1
+        region_counts = self._value_counts(videos['search_region'])
         
         print("\n Region Distribution:")
         for region, count in sorted(region_counts.items()):
@@ -273,16 +337,30 @@ def main():
         # Validate configuration
         Config.validate()
         
+        # Look up channels Snowflake refreshed recently so they are not re-fetched
+        try:
+            loader = SnowflakeLoader()
+            try:
+                fresh_channels = loader.fresh_channel_ids(Config.CHANNEL_CACHE_DAYS)
+            finally:
+                loader.close()
+        except Exception as e:
+            print(f"Could not read channel cache, fetching every channel: {e}\n")
+            fresh_channels = frozenset()
+        
         # Create collector
-        collector = YouTubeCollector()
+        collector = YouTubeCollector(fresh_channels)
         
         # Collect data
         videos, channels = collector.collect_data()
         
         # Upload to Azure
-        success = collector.upload_to_azure(videos, channels)
+        uploaded = collector.upload_to_azure(videos, channels)
+        
+        # Write the local files the Snowflake loader stages, whether or not the upload worked
+        written = collector.write_parquet_files(videos, channels)
         
-        if success:
+        if uploaded and written:
             collector.print_summary(videos)
             print("Data collection completed successfully!\n")
             return 0